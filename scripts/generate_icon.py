@@ -5,145 +5,184 @@ Usage:
   python generate_icon.py
 """
 
+import ctypes
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+import objc
+
 from AppKit import (
-    NSBezierPath,
     NSBitmapImageRep,
-    NSColor,
-    NSCompositingOperationSourceOver,
+    NSCalibratedRGBColorSpace,
     NSGraphicsContext,
     NSImage,
-    NSMakeRect,
-    NSPNGFileType,
 )
-from Foundation import NSMakeSize, NSPoint
+from Foundation import NSURL, NSMakeSize
+from Quartz import (
+    CGAffineTransformMakeTranslation,
+    CGContextAddPath,
+    CGContextClearRect,
+    CGContextClip,
+    CGContextDrawImage,
+    CGContextRestoreGState,
+    CGContextSaveGState,
+    CGContextSetLineWidth,
+    CGContextSetRGBStrokeColor,
+    CGContextStrokePath,
+    CGContextTranslateCTM,
+    CGImageCreateWithImageInRect,
+    CGImageDestinationAddImage,
+    CGImageDestinationCreateWithURL,
+    CGImageDestinationFinalize,
+    CGImageGetHeight,
+    CGImageGetWidth,
+    CGPathAddCurveToPoint,
+    CGPathAddLineToPoint,
+    CGPathCloseSubpath,
+    CGPathCreateCopyByTransformingPath,
+    CGPathCreateMutable,
+    CGPathMoveToPoint,
+    CGRectMake,
+    kCGImagePropertyPNGCompressionFilter,
+    kCGImagePropertyPNGDictionary,
+)
+
+_accelerate = ctypes.CDLL("/System/Library/Frameworks/Accelerate.framework/Accelerate")
+
+kvImageNoError = 0
+kvImageHighQualityResampling = 32
+
+
+class vImage_Buffer(ctypes.Structure):
+    _fields_ = [
+        ("data", ctypes.c_void_p),
+        ("height", ctypes.c_size_t),
+        ("width", ctypes.c_size_t),
+        ("rowBytes", ctypes.c_size_t),
+    ]
+
+
+vImageScale_ARGB8888 = _accelerate.vImageScale_ARGB8888
+vImageScale_ARGB8888.argtypes = [
+    ctypes.POINTER(vImage_Buffer),
+    ctypes.POINTER(vImage_Buffer),
+    ctypes.c_void_p,
+    ctypes.c_uint32,
+]
+vImageScale_ARGB8888.restype = ctypes.c_ssize_t
 
+ROW_ALIGNMENT = 64
 
-def create_squircle_path(x: float, y: float, width: float, height: float) -> NSBezierPath:
+# IMAGEIO_PNG_FILTER_NONE from <ImageIO/CGImageProperties.h>
+IMAGEIO_PNG_FILTER_NONE = 0x08
+
+
+LIMIT_FACTOR = 1.52866483
+
+# Top-right corner coefficients, in units of the corner radius.
+_COEFFS = (
+    1.52866483,  # P1
+    1.08849323,  # P2
+    0.86840689,  # P3
+    0.66993427,  # P4
+    0.63149399,  # P5
+    0.37282392,  # P6
+    0.16906013,  # P7
+    0.06549600,  # CP1
+    0.07491100,  # CP2
+    0.16905899,  # CP3
+    0.37282401,  # CP4
+)
+
+
+def create_squircle_path(x: float, y: float, width: float, height: float):
     """
-    Create Apple's continuous curvature rounded rectangle (squircle).
+    Create Apple's continuous curvature rounded rectangle (squircle) as a CGPath.
     Based on PaintCode's reverse-engineering of iOS 7+ UIBezierPath.
     """
-    path = NSBezierPath.bezierPath()
-
-    LIMIT_FACTOR = 1.52866483
-    TOP_RIGHT_P1 = 1.52866483
-    TOP_RIGHT_P2 = 1.08849323
-    TOP_RIGHT_P3 = 0.86840689
-    TOP_RIGHT_P4 = 0.66993427
-    TOP_RIGHT_P5 = 0.63149399
-    TOP_RIGHT_P6 = 0.37282392
-    TOP_RIGHT_P7 = 0.16906013
-
-    TOP_RIGHT_CP1 = 0.06549600
-    TOP_RIGHT_CP2 = 0.07491100
-    TOP_RIGHT_CP3 = 0.16905899
-    TOP_RIGHT_CP4 = 0.37282401
-
     corner_radius = min(width, height) * 0.22
     max_radius = min(width, height) / 2
-    limited_radius = min(corner_radius, max_radius / LIMIT_FACTOR)
-    r = limited_radius
+    r = min(corner_radius, max_radius / LIMIT_FACTOR)
 
-    left = x
-    right = x + width
-    top = y + height
-    bottom = y
+    return _translated(_build_unit_squircle(r, width, height), x, y)
 
-    path.moveToPoint_(NSPoint(left + r * TOP_RIGHT_P1, top))
-    path.lineToPoint_(NSPoint(right - r * TOP_RIGHT_P1, top))
 
-    path.curveToPoint_controlPoint1_controlPoint2_(
-        NSPoint(right - r * TOP_RIGHT_P4, top - r * TOP_RIGHT_CP1),
-        NSPoint(right - r * TOP_RIGHT_P2, top),
-        NSPoint(right - r * TOP_RIGHT_P3, top),
-    )
-    path.curveToPoint_controlPoint1_controlPoint2_(
-        NSPoint(right - r * TOP_RIGHT_CP2, top - r * TOP_RIGHT_P5),
-        NSPoint(right - r * TOP_RIGHT_P6, top - r * TOP_RIGHT_CP3),
-        NSPoint(right - r * TOP_RIGHT_P7, top - r * TOP_RIGHT_CP4),
-    )
-    path.curveToPoint_controlPoint1_controlPoint2_(
-        NSPoint(right, top - r * TOP_RIGHT_P1),
-        NSPoint(right, top - r * TOP_RIGHT_P3),
-        NSPoint(right, top - r * TOP_RIGHT_P2),
-    )
-
-    path.lineToPoint_(NSPoint(right, bottom + r * TOP_RIGHT_P1))
+def _translated(path, dx: float, dy: float):
+    """Return a copy of the CGPath moved by (dx, dy)."""
+    return CGPathCreateCopyByTransformingPath(path, CGAffineTransformMakeTranslation(dx, dy))
 
-    path.curveToPoint_controlPoint1_controlPoint2_(
-        NSPoint(right - r * TOP_RIGHT_CP1, bottom + r * TOP_RIGHT_P4),
-        NSPoint(right, bottom + r * TOP_RIGHT_P2),
-        NSPoint(right, bottom + r * TOP_RIGHT_P3),
-    )
-    path.curveToPoint_controlPoint1_controlPoint2_(
-        NSPoint(right - r * TOP_RIGHT_P5, bottom + r * TOP_RIGHT_CP2),
-        NSPoint(right - r * TOP_RIGHT_CP3, bottom + r * TOP_RIGHT_P6),
-        NSPoint(right - r * TOP_RIGHT_CP4, bottom + r * TOP_RIGHT_P7),
-    )
-    path.curveToPoint_controlPoint1_controlPoint2_(
-        NSPoint(right - r * TOP_RIGHT_P1, bottom),
-        NSPoint(right - r * TOP_RIGHT_P3, bottom),
-        NSPoint(right - r * TOP_RIGHT_P2, bottom),
-    )
 
-    path.lineToPoint_(NSPoint(left + r * TOP_RIGHT_P1, bottom))
+def _build_unit_squircle(r: float, width: float, height: float):
+    """Build the squircle outline with corner radius r, anchored at the origin."""
+    p1, p2, p3, p4, p5, p6, p7, cp1, cp2, cp3, cp4 = _COEFFS
+    rp1, rp2, rp3, rp4, rp5, rp6, rp7 = r * p1, r * p2, r * p3, r * p4, r * p5, r * p6, r * p7
+    rcp1, rcp2, rcp3, rcp4 = r * cp1, r * cp2, r * cp3, r * cp4
 
-    path.curveToPoint_controlPoint1_controlPoint2_(
-        NSPoint(left + r * TOP_RIGHT_P4, bottom + r * TOP_RIGHT_CP1),
-        NSPoint(left + r * TOP_RIGHT_P2, bottom),
-        NSPoint(left + r * TOP_RIGHT_P3, bottom),
-    )
-    path.curveToPoint_controlPoint1_controlPoint2_(
-        NSPoint(left + r * TOP_RIGHT_CP2, bottom + r * TOP_RIGHT_P5),
-        NSPoint(left + r * TOP_RIGHT_P6, bottom + r * TOP_RIGHT_CP3),
-        NSPoint(left + r * TOP_RIGHT_P7, bottom + r * TOP_RIGHT_CP4),
+    # Each corner is the same three curves, given as (a, b) offsets from the
+    # corner point: a runs back along the incoming edge, b along the outgoing one.
+    curves = (
+        ((rp2, 0.0), (rp3, 0.0), (rp4, rcp1)),
+        ((rp6, rcp3), (rp7, rcp4), (rcp2, rp5)),
+        ((0.0, rp3), (0.0, rp2), (0.0, rp1)),
     )
-    path.curveToPoint_controlPoint1_controlPoint2_(
-        NSPoint(left, bottom + r * TOP_RIGHT_P1),
-        NSPoint(left, bottom + r * TOP_RIGHT_P3),
-        NSPoint(left, bottom + r * TOP_RIGHT_P2),
-    )
-
-    path.lineToPoint_(NSPoint(left, top - r * TOP_RIGHT_P1))
 
-    path.curveToPoint_controlPoint1_controlPoint2_(
-        NSPoint(left + r * TOP_RIGHT_CP1, top - r * TOP_RIGHT_P4),
-        NSPoint(left, top - r * TOP_RIGHT_P2),
-        NSPoint(left, top - r * TOP_RIGHT_P3),
-    )
-    path.curveToPoint_controlPoint1_controlPoint2_(
-        NSPoint(left + r * TOP_RIGHT_P5, top - r * TOP_RIGHT_CP2),
-        NSPoint(left + r * TOP_RIGHT_CP3, top - r * TOP_RIGHT_P6),
-        NSPoint(left + r * TOP_RIGHT_CP4, top - r * TOP_RIGHT_P7),
-    )
-    path.curveToPoint_controlPoint1_controlPoint2_(
-        NSPoint(left + r * TOP_RIGHT_P1, top),
-        NSPoint(left + r * TOP_RIGHT_P3, top),
-        NSPoint(left + r * TOP_RIGHT_P2, top),
-    )
-
-    path.closePath()
+    path = CGPathCreateMutable()
+    CGPathMoveToPoint(path, None, rp1, height)
+
+    # Clockwise from the top-right: (corner x, corner y, a direction, b direction)
+    for cx, cy, ax, ay, bx, by in (
+        (width, height, -1.0, 0.0, 0.0, -1.0),
+        (width, 0.0, 0.0, 1.0, -1.0, 0.0),
+        (0.0, 0.0, 1.0, 0.0, 0.0, 1.0),
+        (0.0, height, 0.0, -1.0, 1.0, 0.0),
+    ):
+        CGPathAddLineToPoint(path, None, cx + ax * rp1, cy + ay * rp1)
+        for (a1, b1), (a2, b2), (a3, b3) in curves:
+            CGPathAddCurveToPoint(
+                path, None,
+                cx + ax * a1 + bx * b1, cy + ay * a1 + by * b1,
+                cx + ax * a2 + bx * b2, cy + ay * a2 + by * b2,
+                cx + ax * a3 + bx * b3, cy + ay * a3 + by * b3,
+            )
+
+    CGPathCloseSubpath(path)
     return path
 
 
-def load_source_image(source_path: Path) -> NSImage:
-    """Load the source image file."""
+def load_source_image(source_path: Path):
+    """Load the source image file as a CGImage."""
     image = NSImage.alloc().initWithContentsOfFile_(str(source_path))
     if image is None:
         raise FileNotFoundError(f"Could not load image: {source_path}")
-    return image
+    cgimage, _ = image.CGImageForProposedRect_context_hints_(None, None, None)
+    if cgimage is None:
+        raise ValueError(f"Could not decode image: {source_path}")
+    return cgimage
 
 
-def create_icon(source_image: NSImage, size: int = 1024) -> NSImage:
-    """Create the app icon by applying squircle mask to source image with bevel effect."""
-    from AppKit import NSCalibratedRGBColorSpace
+def _aligned_row_bytes(width: int) -> int:
+    """Row stride for a 4-byte-per-pixel bitmap, rounded up to a multiple of 64 bytes.
 
+    Core Graphics copies bitmaps with unaligned rows into an aligned buffer
+    before compositing or resampling them.
+    """
+    return (width * 4 + ROW_ALIGNMENT - 1) & ~(ROW_ALIGNMENT - 1)
+
+
+def _new_bitmap(size: int) -> NSBitmapImageRep:
+    """Allocate a square 8-bit RGBA bitmap of the given pixel size."""
     bitmap = NSBitmapImageRep.alloc().initWithBitmapDataPlanes_pixelsWide_pixelsHigh_bitsPerSample_samplesPerPixel_hasAlpha_isPlanar_colorSpaceName_bytesPerRow_bitsPerPixel_(
-        None, size, size, 8, 4, True, False, NSCalibratedRGBColorSpace, 0, 0,
+        None, size, size, 8, 4, True, False, NSCalibratedRGBColorSpace, _aligned_row_bytes(size), 32,
     )
     bitmap.setSize_(NSMakeSize(size, size))
+    return bitmap
+
+
+def create_icon(source_image, bitmap: NSBitmapImageRep) -> NSBitmapImageRep:
+    """Render the app icon into bitmap by applying squircle mask to source image with bevel effect."""
+    size = bitmap.pixelsWide()
 
     ctx = NSGraphicsContext.graphicsContextWithBitmapImageRep_(bitmap)
     NSGraphicsContext.setCurrentContext_(ctx)
@@ -155,77 +194,98 @@ def create_icon(source_image: NSImage, size: int = 1024) -> NSImage:
 
     squircle_path = create_squircle_path(margin, margin, icon_size, icon_size)
 
+    cgctx = ctx.CGContext()
+    CGContextClearRect(cgctx, CGRectMake(0, 0, size, size))
+
+    # The artwork and the bevel share one clip.
     ctx.saveGraphicsState()
-    squircle_path.addClip()
+    CGContextAddPath(cgctx, squircle_path)
+    CGContextClip(cgctx)
 
     # Draw source image zoomed in to make the symbol larger
-    source_size = source_image.size()
+    source_width = CGImageGetWidth(source_image)
+    source_height = CGImageGetHeight(source_image)
     crop_ratio = 0.15
-    crop_px = source_size.width * crop_ratio
-    source_image.drawInRect_fromRect_operation_fraction_(
-        NSMakeRect(margin, margin, icon_size, icon_size),
-        NSMakeRect(crop_px, crop_px, source_size.width - crop_px * 2, source_size.height - crop_px * 2),
-        NSCompositingOperationSourceOver,
-        1.0,
+    crop_px = source_width * crop_ratio
+    cropped = CGImageCreateWithImageInRect(
+        source_image,
+        CGRectMake(crop_px, crop_px, source_width - crop_px * 2, source_height - crop_px * 2),
     )
-
-    ctx.restoreGraphicsState()
+    CGContextDrawImage(cgctx, CGRectMake(margin, margin, icon_size, icon_size), cropped)
 
     # Bevel effect using offset strokes
     bevel_offset = size * 0.004
     stroke_width = size * 0.008
 
-    ctx.saveGraphicsState()
-    squircle_path.addClip()
-
-    highlight_path = create_squircle_path(
-        margin + bevel_offset, margin - bevel_offset, icon_size, icon_size,
-    )
-    highlight_path.setLineWidth_(stroke_width)
-    NSColor.colorWithCalibratedRed_green_blue_alpha_(1.0, 1.0, 1.0, 0.5).setStroke()
-    highlight_path.stroke()
-
-    shadow_path = create_squircle_path(
-        margin - bevel_offset, margin + bevel_offset, icon_size, icon_size,
-    )
-    shadow_path.setLineWidth_(stroke_width)
-    NSColor.colorWithCalibratedRed_green_blue_alpha_(0.0, 0.0, 0.0, 0.25).setStroke()
-    shadow_path.stroke()
+    CGContextSetLineWidth(cgctx, stroke_width)
+
+    # Highlight and shadow stroke the same path, shifted via the CTM (the
+    # clip set above stays in place).
+    for dx, dy, (red, green, blue, alpha) in (
+        (bevel_offset, -bevel_offset, (1.0, 1.0, 1.0, 0.5)),
+        (-bevel_offset, bevel_offset, (0.0, 0.0, 0.0, 0.25)),
+    ):
+        CGContextSaveGState(cgctx)
+        CGContextTranslateCTM(cgctx, dx, dy)
+        CGContextSetRGBStrokeColor(cgctx, red, green, blue, alpha)
+        CGContextAddPath(cgctx, squircle_path)
+        CGContextStrokePath(cgctx)
+        CGContextRestoreGState(cgctx)
 
     ctx.restoreGraphicsState()
 
     NSGraphicsContext.setCurrentContext_(None)
 
-    image = NSImage.alloc().initWithSize_(NSMakeSize(size, size))
-    image.addRepresentation_(bitmap)
-    return image
+    return bitmap
 
 
-def save_png(image: NSImage, path: Path, size: int, source_size: int = 1024):
-    """Save NSImage as PNG at specified pixel size."""
-    from AppKit import NSCalibratedRGBColorSpace
+def _vimage_buffer(bitmap: NSBitmapImageRep) -> vImage_Buffer:
+    """Describe the pixels of a non-planar RGBA bitmap as a vImage buffer (no copy).
 
-    bitmap = NSBitmapImageRep.alloc().initWithBitmapDataPlanes_pixelsWide_pixelsHigh_bitsPerSample_samplesPerPixel_hasAlpha_isPlanar_colorSpaceName_bytesPerRow_bitsPerPixel_(
-        None, size, size, 8, 4, True, False, NSCalibratedRGBColorSpace, 0, 0,
+    The data pointer stays valid for as long as *bitmap* is alive.
+    """
+    data = bitmap.bitmapData()
+    pixels = (ctypes.c_ubyte * len(data)).from_buffer(data)
+    return vImage_Buffer(
+        ctypes.addressof(pixels), bitmap.pixelsHigh(), bitmap.pixelsWide(), bitmap.bytesPerRow(),
     )
-    bitmap.setSize_(NSMakeSize(size, size))
 
-    ctx = NSGraphicsContext.graphicsContextWithBitmapImageRep_(bitmap)
-    NSGraphicsContext.setCurrentContext_(ctx)
-    ctx.setImageInterpolation_(3)
 
-    image.drawInRect_fromRect_operation_fraction_(
-        NSMakeRect(0, 0, size, size),
-        NSMakeRect(0, 0, source_size, source_size),
-        NSCompositingOperationSourceOver,
-        1.0,
-    )
+def save_png(
+    source: NSBitmapImageRep, source_buffer: vImage_Buffer, bitmap: NSBitmapImageRep, path: Path,
+):
+    """Save the rendered bitmap as PNG, resampled into the pre-allocated bitmap's pixel size.
 
-    NSGraphicsContext.setCurrentContext_(None)
-
-    png_data = bitmap.representationUsingType_properties_(NSPNGFileType, None)
-    png_data.writeToFile_atomically_(str(path), True)
-    print(f"  Created: {path.name} ({size}x{size})")
+    Safe to call from worker threads: *source* is only read, and
+    *source_buffer* is obtained once on the calling thread.
+    """
+    if bitmap is not source:
+        size = bitmap.pixelsWide()
+
+        # vImage only cares about 4 x 8-bit premultiplied channels, so the
+        # ARGB variant handles AppKit's RGBA layout as-is.
+        dest = _vimage_buffer(bitmap)
+        err = vImageScale_ARGB8888(
+            ctypes.byref(source_buffer), ctypes.byref(dest), None, kvImageHighQualityResampling,
+        )
+        if err != kvImageNoError:
+            raise RuntimeError(f"vImageScale_ARGB8888 failed ({err}) for {size}x{size}")
+
+    write_png(bitmap, path)
+
+
+def write_png(bitmap: NSBitmapImageRep, path: Path):
+    """Encode the bitmap as PNG via ImageIO, skipping per-row filtering and extra metadata."""
+    dest = CGImageDestinationCreateWithURL(NSURL.fileURLWithPath_(str(path)), "public.png", 1, None)
+    if dest is None:
+        raise OSError(f"Could not create image destination: {path}")
+    CGImageDestinationAddImage(
+        dest,
+        bitmap.CGImage(),
+        {kCGImagePropertyPNGDictionary: {kCGImagePropertyPNGCompressionFilter: IMAGEIO_PNG_FILTER_NONE}},
+    )
+    if not CGImageDestinationFinalize(dest):
+        raise OSError(f"Could not write PNG: {path}")
 
 
 def main():
@@ -244,15 +304,28 @@ def main():
     print(f"Loading source image: {source_path}")
     source_image = load_source_image(source_path)
 
-    print("Creating icon with squircle mask...")
-    icon = create_icon(source_image, 1024)
-
     sizes = [16, 32, 64, 128, 256, 512, 1024]
 
+    # Every target bitmap is allocated up front on the main thread; vImage
+    # overwrites each destination completely, so none need clearing.
+    bitmaps = {size: _new_bitmap(size) for size in sizes}
+
+    print("Creating icon with squircle mask...")
+    icon = create_icon(source_image, bitmaps[max(sizes)])
+
     print("\nGenerating PNG icons...")
-    for size in sizes:
+    icon_buffer = _vimage_buffer(icon)
+
+    def export(size: int) -> Path:
         output_path = output_dir / f"appicon_{size}.png"
-        save_png(icon, output_path, size)
+        with objc.autorelease_pool():
+            save_png(icon, icon_buffer, bitmaps[size], output_path)
+        return output_path
+
+    # vImage and the PNG encoder run outside the GIL, so the sizes encode in parallel.
+    with ThreadPoolExecutor(max_workers=min(len(sizes), os.cpu_count() or 1)) as executor:
+        for size, output_path in zip(sizes, executor.map(export, sizes)):
+            print(f"  Created: {output_path.name} ({size}x{size})")
 
     # Write Contents.json
     contents = {
@@ -262,10 +335,13 @@ def main():
         ],
         "info": {"author": "xcode", "version": 1},
     }
-    import json
     contents_path = output_dir / "Contents.json"
-    contents_path.write_text(json.dumps(contents, indent=2) + "\n")
-    print(f"  Created: Contents.json")
+    new_contents = json.dumps(contents, indent=2) + "\n"
+    if contents_path.exists() and contents_path.read_text() == new_contents:
+        print("  Unchanged: Contents.json")
+    else:
+        contents_path.write_text(new_contents)
+        print("  Created: Contents.json")
 
     print("\nAll icons generated successfully!")
 